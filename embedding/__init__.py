@@ -1,54 +1,68 @@
+from collections import deque
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Any, Dict, List
+from typing import Any, Deque, Dict, Iterable, Iterator, Sequence
 
-@dataclass
+@dataclass(slots=True)
 class Message:
     timestamp: datetime
     sender: str
     content: str
 
-def chunk_messages(messages: List[Message], chunk_size: int = 10, overlap: int = 2) -> List[Dict[str, Any]]:
+def chunk_messages(messages: Iterable[Message], chunk_size: int = 10, overlap: int = 2) -> Iterator[Dict[str, Any]]:
     """
     Chunk messages with overlap to maintain context.
+
+    Messages are consumed lazily through a rolling window, so chunks are
+    produced while the input is still being read.
     
     Args:
-        messages: List of Message objects
+        messages: Iterable of Message objects
         chunk_size: Number of messages per chunk
         overlap: Number of messages to overlap between chunks
         
     Returns:
-        List of chunk dictionaries with ids and text
+        Iterator of chunk dictionaries with ids and text
     """
-    chunks = []
+    step = chunk_size - overlap
+    window: Deque[Message] = deque(maxlen=chunk_size)
+    count = 0
+
+    for msg in messages:
+        window.append(msg)
+        count += 1
+
+        # A full chunk starts every `step` messages
+        start = count - chunk_size
+        if start >= 0 and start % step == 0:
+            yield _make_chunk(start, window)
 
-    for i in range(0, len(messages), chunk_size - overlap):
-        chunk_messages = messages[i:i + chunk_size]
+    # Trailing chunks start at the remaining step boundaries and run short
+    first = max(0, count - chunk_size + 1)
+    first += -first % step
+    for start in range(first, count, step):
+        chunk_messages = list(window)[start - count:]
         if len(chunk_messages) < 2:  # Skip chunks that are too small
             continue
+        yield _make_chunk(start, chunk_messages)
 
-        # Format messages for this chunk
-        formatted_messages = []
-        for msg in chunk_messages:
-            formatted_messages.append(f"[{msg.timestamp}] {msg.sender}: {msg.content}")
-
-        chunk_text = "\n".join(formatted_messages)
-
-        # Create a timestamp range for the chunk ID
-        start_time = int(chunk_messages[0].timestamp.timestamp())
-        end_time = int(chunk_messages[-1].timestamp.timestamp())
-        chunk_id = f"chunk_{i}_{start_time}_{end_time}".replace(" ", "_").replace(":", "-")
-
-        chunk = {
-            'id': chunk_id,
-            'text': chunk_text,
-            'metadata': {
-                'start_time': start_time,
-                'end_time': end_time,
-                'message_count': len(chunk_messages),
-                'senders': ','.join(set([msg.sender for msg in chunk_messages])),
-            }
-        }
-        chunks.append(chunk)
+def _make_chunk(i: int, chunk_messages: Sequence[Message]) -> Dict[str, Any]:
+    # Format messages for this chunk
+    chunk_text = "\n".join([f"[{msg.timestamp}] {msg.sender}: {msg.content}" for msg in chunk_messages])
+
+    # Create a timestamp range for the chunk ID
+    start_time = int(chunk_messages[0].timestamp.timestamp())
+    end_time = int(chunk_messages[-1].timestamp.timestamp())
+    chunk_id = f"chunk_{i}_{start_time}_{end_time}"
 
-    return chunks
+    return {
+        'id': chunk_id,
+        'text': chunk_text,
+        'metadata': {
+            'start_index': i,
+            'start_time': start_time,
+            'end_time': end_time,
+            'message_count': len(chunk_messages),
+            'senders': ','.join(dict.fromkeys(msg.sender for msg in chunk_messages)),
+        }
+    }
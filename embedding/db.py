@@ -1,24 +1,44 @@
 import os
-from typing import Any, Dict
+from typing import Any, Dict, List, Protocol
 import chromadb
+import numpy as np
 from embedding.tinfoil_embedding import TinfoilAIEmbeddingFunction
 
 
-def get_embedding_collection(chroma_dir: str, tinfoil_api_key: str) -> chromadb.Collection:
+class VectorStore(Protocol):
     """
-    Get or create a ChromaDB collection with the OpenAI embedding function.
+    The part of the chromadb.Collection API used for ingestion and queries.
+    A Chroma collection satisfies it, as does embedding.faiss_store.FaissStore.
     """
 
-    os.makedirs(chroma_dir, exist_ok=True)
-    chroma_client = chromadb.PersistentClient(path=chroma_dir)
+    def add(self, ids, embeddings, metadatas, documents) -> None: ...
+
+    def get(self, ids=None, where=None, include=None) -> Dict[str, Any]: ...
 
-    tinfoil_ef = TinfoilAIEmbeddingFunction(
+    def delete(self, ids) -> None: ...
+
+    def query(self, query_embeddings, n_results, include) -> Dict[str, Any]: ...
+
+def get_embedding_function(tinfoil_api_key: str) -> TinfoilAIEmbeddingFunction:
+    """
+    Create the Tinfoil embedding function, so callers can share one client.
+    """
+
+    return TinfoilAIEmbeddingFunction(
         api_key=tinfoil_api_key,
         enclave="nomic-embed-text.model.tinfoil.sh",
         repo="tinfoilsh/confidential-nomic-embed-text",
         model_name="nomic-embed-text"
     )
 
+def get_embedding_collection(chroma_dir: str, tinfoil_ef: TinfoilAIEmbeddingFunction) -> chromadb.Collection:
+    """
+    Get or create a ChromaDB collection with the Tinfoil embedding function.
+    """
+
+    os.makedirs(chroma_dir, exist_ok=True)
+    chroma_client = chromadb.PersistentClient(path=chroma_dir)
+
     COLLECTION_NAME = "text_messages"
 
     try:
@@ -35,49 +55,114 @@ def get_embedding_collection(chroma_dir: str, tinfoil_api_key: str) -> chromadb.
 
     return collection
 
-def add_chunks_to_chroma(collection: chromadb.Collection, chunks):
+def filter_new_chunks(collection: VectorStore, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
-    Add message chunks to ChromaDB.
-    
-    Args:
-        collection: ChromaDB collection
-        chunks: List of chunk dictionaries
+    Drop chunks whose ids are already stored in the collection.
+
+    Chunk ids are derived from message position and timestamps, so re-running
+    an import produces the same ids and only new chunks need embedding.
     """
 
-    ids = [chunk['id'] for chunk in chunks]
-    texts = [chunk['text'] for chunk in chunks]
-    metadatas = [chunk['metadata'] for chunk in chunks]
-    
-    # Add to collection in batches
-    batch_size = 50
-    for i in range(0, len(ids), batch_size):
-        batch_ids = ids[i:i+batch_size]
-        batch_texts = texts[i:i+batch_size]
-        batch_metadatas = metadatas[i:i+batch_size]
-
-        print(f"Adding {len(batch_ids)} chunks (batch {i//batch_size + 1}/{(len(ids)-1)//batch_size + 1})")
-        
-        collection.add(
-            ids=batch_ids,
-            documents=batch_texts,
-            metadatas=batch_metadatas
-        )
+    if not chunks:
+        return chunks
 
-def query_messages(collection, question: str, n_results: int = 5) -> Dict[str, Any]:
+    existing = set(collection.get(ids=[chunk['id'] for chunk in chunks], include=[])['ids'])
+    return [chunk for chunk in chunks if chunk['id'] not in existing]
+
+def remove_superseded_chunks(collection: VectorStore, chunks: List[Dict[str, Any]]) -> int:
+    """
+    Delete stored chunks that the given new chunks replace.
+
+    Chunk ids end with the last message's timestamp, so when an export grows,
+    the short chunks that used to end it come back with more messages under
+    new ids. A stored chunk with the same start index and start time as a new
+    chunk but a different id is such a stale version. Chunks stored before
+    start_index was recorded in their metadata cannot be matched.
+
+    Returns:
+        Number of chunks deleted
+    """
+
+    if not chunks:
+        return 0
+
+    starts = {(chunk['metadata']['start_index'], chunk['metadata']['start_time']) for chunk in chunks}
+    new_ids = {chunk['id'] for chunk in chunks}
+    stored = collection.get(
+        where={'start_index': {'$in': sorted({start_index for start_index, _ in starts})}},
+        include=['metadatas'],
+    )
+    stale = [
+        chunk_id for chunk_id, metadata in zip(stored['ids'], stored['metadatas'])
+        if chunk_id not in new_ids and (metadata.get('start_index'), metadata.get('start_time')) in starts
+    ]
+    if stale:
+        collection.delete(ids=stale)
+    return len(stale)
+
+def rerank(query_embedding, candidate_embeddings) -> np.ndarray:
+    """
+    Score candidates by exact cosine similarity to the query.
+
+    Candidates are packed into one contiguous (N, D) float32 matrix so the
+    scores come from a single matrix-vector product.
+
+    Args:
+        query_embedding: Query vector of length D
+        candidate_embeddings: N candidate vectors of length D
+
+    Returns:
+        Array of N cosine similarities
+    """
+    query = np.asarray(query_embedding, dtype=np.float32)
+    candidates = np.ascontiguousarray(candidate_embeddings, dtype=np.float32)
+    scores = candidates @ query
+    scores /= np.linalg.norm(candidates, axis=1) * np.linalg.norm(query)
+    return scores
+
+def query_messages(
+    collection: VectorStore,
+    embedding_function: TinfoilAIEmbeddingFunction,
+    question: str,
+    n_results: int = 5,
+    fetch_k: int = 0,
+) -> Dict[str, Any]:
     """
     Query the message database with a natural language question.
     
     Args:
         collection: ChromaDB collection
+        embedding_function: Embedding function used for the question
         question: Natural language question
         n_results: Number of results to return
+        fetch_k: If larger than n_results, fetch this many approximate
+            neighbours and keep the n_results best by exact cosine similarity
         
     Returns:
         List of result dictionaries
     """
+    query_embedding = embedding_function([question])[0]
+
+    if fetch_k > n_results:
+        results = collection.query(
+            query_embeddings=[query_embedding],
+            n_results=fetch_k,
+            include=['documents', 'metadatas', 'embeddings']
+        )
+        scores = rerank(query_embedding, results['embeddings'][0])
+        top = np.argsort(-scores)[:n_results]
+        return {
+            'question': question,
+            'documents': [results['documents'][0][i] for i in top],
+            'metadatas': [results['metadatas'][0][i] for i in top],
+            'ids': [results['ids'][0][i] for i in top],
+            'distances': [float(1 - scores[i]) for i in top]
+        }
+
     results = collection.query(
-        query_texts=[question],
-        n_results=n_results
+        query_embeddings=[query_embedding],
+        n_results=n_results,
+        include=['documents', 'metadatas', 'distances']
     )
     
     return {
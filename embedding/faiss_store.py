@@ -0,0 +1,328 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+import numpy as np
+
+try:
+    import faiss
+except ImportError:  # optional backend
+    faiss = None
+
+
+class FaissStore:
+    """
+    On-disk vector store backed by sharded FAISS IVF-PQ indexes.
+
+    Implements the subset of the chromadb.Collection API used by ingestion
+    and queries (add, get, delete, query), so it can stand in for a
+    collection.
+    Chunk text and metadata live in a sidecar SQLite database; the indexes
+    keep only compressed PQ codes keyed by the SQLite rowid.
+
+    Vectors are kept uncompressed (and searched exactly) until train_size
+    of them have arrived, at which point the IVF-PQ index is trained on
+    them once and every later vector goes into the current shard. IVF needs
+    about 39 training points per list, so nlist is capped at
+    train_size // 39; the defaults give the full 4096 lists.
+
+    Every vector is committed to SQLite together with its chunk row and only
+    removed from there once the shard holding it is written, so vectors
+    missing from the shard files after a crash are re-added on open. The
+    current shard is checkpointed every checkpoint_size vectors, so after
+    training at most that many raw vectors sit in SQLite (before training
+    all train_size of them do, as training needs them). The database uses
+    incremental auto-vacuum, so it shrinks again once they are deleted.
+    Call flush() after ingesting to write the remaining shards.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        dim: int = 768,
+        nlist: int = 4096,
+        m: int = 64,
+        nbits: int = 8,
+        train_size: int = 160_000,
+        shard_size: int = 1_000_000,
+        checkpoint_size: int = 20_000,
+        nprobe: int = 16,
+    ):
+        if faiss is None:
+            raise ImportError("The faiss backend requires faiss: pip install faiss-cpu")
+
+        self.path = path
+        self.dim = dim
+        self.nlist = nlist
+        self.m = m
+        self.nbits = nbits
+        self.train_size = train_size
+        self.shard_size = shard_size
+        self.checkpoint_size = checkpoint_size
+        self.nprobe = nprobe
+
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(path, "chunks.sqlite"), check_same_thread=False)
+        # Give space freed by deleted vectors back to the filesystem; existing
+        # databases only switch mode after a full VACUUM
+        if self._db.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            self._db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            self._db.execute("VACUUM")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "rowid INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT UNIQUE NOT NULL, document TEXT, metadata TEXT)"
+        )
+        # Vectors not yet written to a shard file
+        self._db.execute("CREATE TABLE IF NOT EXISTS unflushed (rowid INTEGER PRIMARY KEY, embedding BLOB)")
+        self._db.commit()
+
+        # Vectors waiting for the index to be trained, searched exactly
+        self._pending_ids: List[int] = []
+        self._pending: List[np.ndarray] = []
+        self._pending_matrix: Optional[np.ndarray] = None
+        self._trained = os.path.exists(self._trained_path)
+
+        self._shards = []
+        # Rowids held by each in-memory shard but not yet in its file
+        self._unflushed: Dict[int, List[int]] = {}
+        while os.path.exists(self._shard_path(len(self._shards))):
+            self._shards.append(faiss.read_index(self._shard_path(len(self._shards))))
+
+        cursor = self._db.execute("SELECT rowid, embedding FROM unflushed ORDER BY rowid")
+        while True:
+            rows = cursor.fetchmany(self.checkpoint_size)
+            if not rows:
+                break
+            rowids = np.array([rowid for rowid, _ in rows], dtype=np.int64)
+            vectors = np.stack([np.frombuffer(blob, dtype=np.float32) for _, blob in rows])
+            if self._trained:
+                # A flush may have written some of these before it was
+                # interrupted; remove them so they are not indexed twice
+                for shard in self._shards:
+                    shard.remove_ids(faiss.IDSelectorBatch(rowids))
+                self._add_to_shards(rowids, vectors)
+            else:
+                self._pending_ids.extend(int(r) for r in rowids)
+                self._pending.extend(vectors)
+
+    def _shard_path(self, n: int) -> str:
+        return os.path.join(self.path, f"shard_{n:04d}.index")
+
+    @property
+    def _trained_path(self) -> str:
+        return os.path.join(self.path, "trained.index")
+
+    def add(self, ids, embeddings, metadatas=None, documents=None) -> None:
+        vectors = np.ascontiguousarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-dimensional embeddings, got {vectors.shape[1]}")
+        metadatas = metadatas or [None] * len(ids)
+        documents = documents or [None] * len(ids)
+
+        with self._lock:
+            # Like Chroma, ignore ids that are already stored
+            rowids, keep = [], []
+            for i, (chunk_id, document, metadata) in enumerate(zip(ids, documents, metadatas)):
+                cursor = self._db.execute(
+                    "INSERT OR IGNORE INTO chunks (id, document, metadata) VALUES (?, ?, ?)",
+                    (chunk_id, document, json.dumps(metadata)),
+                )
+                if cursor.rowcount:
+                    rowids.append(cursor.lastrowid)
+                    keep.append(i)
+            vectors = vectors[keep]
+
+            self._db.executemany(
+                "INSERT INTO unflushed (rowid, embedding) VALUES (?, ?)",
+                [(rowid, v.tobytes()) for rowid, v in zip(rowids, vectors)],
+            )
+            self._db.commit()
+
+            if self._trained:
+                self._add_to_shards(np.array(rowids, dtype=np.int64), vectors)
+            else:
+                self._pending_ids.extend(rowids)
+                self._pending.extend(vectors)
+                self._pending_matrix = None
+                if len(self._pending) >= self.train_size:
+                    self._train()
+
+            # Full shards never change again, so write them out right away;
+            # checkpoint the others so raw vectors don't pile up in SQLite
+            for n in list(self._unflushed):
+                if (self._shards[n].ntotal >= self.shard_size
+                        or len(self._unflushed[n]) >= self.checkpoint_size):
+                    self._write_shard(n)
+
+    def _train(self) -> None:
+        vectors = np.stack(self._pending)
+        nlist = max(1, min(self.nlist, len(vectors) // 39))
+        quantizer = faiss.IndexFlatIP(self.dim)
+        index = faiss.IndexIVFPQ(quantizer, self.dim, nlist, self.m, self.nbits, faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+        faiss.write_index(index, self._trained_path)
+        self._trained = True
+
+        self._add_to_shards(np.array(self._pending_ids, dtype=np.int64), vectors)
+        self._pending_ids = []
+        self._pending = []
+        self._pending_matrix = None
+
+    def _add_to_shards(self, rowids: np.ndarray, vectors: np.ndarray) -> None:
+        while len(rowids):
+            if not self._shards or self._shards[-1].ntotal >= self.shard_size:
+                self._shards.append(faiss.read_index(self._trained_path))
+            n = len(self._shards) - 1
+            room = self.shard_size - self._shards[n].ntotal
+            self._shards[n].add_with_ids(vectors[:room], rowids[:room])
+            self._unflushed.setdefault(n, []).extend(int(r) for r in rowids[:room])
+            rowids, vectors = rowids[room:], vectors[room:]
+
+    def _write_shard(self, n: int) -> None:
+        # Replace the file atomically, then forget the vectors it now holds
+        tmp_path = self._shard_path(n) + ".tmp"
+        faiss.write_index(self._shards[n], tmp_path)
+        os.replace(tmp_path, self._shard_path(n))
+
+        rowids = self._unflushed.pop(n, [])
+        for i in range(0, len(rowids), 900):
+            batch = rowids[i:i + 900]
+            placeholders = ",".join("?" * len(batch))
+            self._db.execute(f"DELETE FROM unflushed WHERE rowid IN ({placeholders})", batch)
+        self._db.commit()
+        # execute() would step the pragma once and free a single page
+        self._db.executescript("PRAGMA incremental_vacuum;")
+
+    def flush(self) -> None:
+        """
+        Write shards changed since the last flush to disk.
+        """
+        with self._lock:
+            for n in sorted(self._unflushed):
+                self._write_shard(n)
+
+    def get(self, ids=None, where=None, include=None) -> Dict[str, Any]:
+        """
+        Fetch chunks by id and/or metadata filter. where supports
+        {key: value} and {key: {'$in': [values]}} conditions, ANDed together.
+        """
+        include = include if include is not None else ['documents', 'metadatas']
+        conditions, params = [], []
+        for key, condition in (where or {}).items():
+            values = condition['$in'] if isinstance(condition, dict) else [condition]
+            if not values:
+                return {'ids': [], 'documents': [], 'metadatas': []}
+            conditions.append(f"json_extract(metadata, ?) IN ({','.join('?' * len(values))})")
+            params.extend([f"$.{key}", *values])
+
+        rows = {}
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            id_batches = [ids[i:i + 900] for i in range(0, len(ids), 900)] if ids is not None else [None]
+            for batch in id_batches:
+                sql = "SELECT id, document, metadata FROM chunks"
+                clauses, args = list(conditions), list(params)
+                if batch is not None:
+                    clauses.append(f"id IN ({','.join('?' * len(batch))})")
+                    args.extend(batch)
+                if clauses:
+                    sql += " WHERE " + " AND ".join(clauses)
+                for chunk_id, document, metadata in self._db.execute(sql + " ORDER BY rowid", args):
+                    rows[chunk_id] = (document, json.loads(metadata))
+
+        found = [chunk_id for chunk_id in ids if chunk_id in rows] if ids is not None else list(rows)
+        results: Dict[str, Any] = {'ids': found}
+        if 'documents' in include:
+            results['documents'] = [rows[chunk_id][0] for chunk_id in found]
+        if 'metadatas' in include:
+            results['metadatas'] = [rows[chunk_id][1] for chunk_id in found]
+        return results
+
+    def delete(self, ids) -> None:
+        with self._lock:
+            rowids = []
+            for i in range(0, len(ids), 900):
+                batch = list(ids[i:i + 900])
+                placeholders = ",".join("?" * len(batch))
+                rowids.extend(r for (r,) in self._db.execute(
+                    f"SELECT rowid FROM chunks WHERE id IN ({placeholders})", batch
+                ))
+            if not rowids:
+                return
+
+            for i in range(0, len(rowids), 900):
+                batch = rowids[i:i + 900]
+                placeholders = ",".join("?" * len(batch))
+                self._db.execute(f"DELETE FROM chunks WHERE rowid IN ({placeholders})", batch)
+                self._db.execute(f"DELETE FROM unflushed WHERE rowid IN ({placeholders})", batch)
+            self._db.commit()
+            self._db.executescript("PRAGMA incremental_vacuum;")
+
+            removed = set(rowids)
+            if self._pending_ids:
+                keep = [i for i, rowid in enumerate(self._pending_ids) if rowid not in removed]
+                self._pending_ids = [self._pending_ids[i] for i in keep]
+                self._pending = [self._pending[i] for i in keep]
+                self._pending_matrix = None
+
+            # Shards that lost vectors are rewritten on the next flush; until
+            # then their files may still return the deleted rowids, which
+            # queries skip
+            selector = faiss.IDSelectorBatch(np.array(rowids, dtype=np.int64))
+            for n, shard in enumerate(self._shards):
+                if shard.remove_ids(selector):
+                    unflushed = self._unflushed.setdefault(n, [])
+                    unflushed[:] = [rowid for rowid in unflushed if rowid not in removed]
+
+    def query(self, query_embeddings, n_results: int = 10, include=None) -> Dict[str, Any]:
+        include = include if include is not None else ['documents', 'metadatas', 'distances']
+        if 'embeddings' in include:
+            raise ValueError("The faiss backend stores compressed codes and cannot return embeddings")
+
+        queries = np.ascontiguousarray(query_embeddings, dtype=np.float32).reshape(-1, self.dim)
+        results: Dict[str, List[Any]] = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+
+        with self._lock:
+            for query in queries:
+                scores, rowids = self._search(query, n_results)
+                rows = {}
+                if len(rowids):
+                    placeholders = ",".join("?" * len(rowids))
+                    for rowid, chunk_id, document, metadata in self._db.execute(
+                        f"SELECT rowid, id, document, metadata FROM chunks WHERE rowid IN ({placeholders})",
+                        [int(r) for r in rowids],
+                    ):
+                        rows[rowid] = (chunk_id, document, json.loads(metadata))
+                hits = [(rows[int(r)], float(s)) for r, s in zip(rowids, scores) if int(r) in rows]
+                results['ids'].append([row[0] for row, _ in hits])
+                results['documents'].append([row[1] for row, _ in hits])
+                results['metadatas'].append([row[2] for row, _ in hits])
+                # Embeddings are L2-normalized, so 1 - inner product is the cosine distance
+                results['distances'].append([1 - s for _, s in hits])
+
+        return {key: value for key, value in results.items() if key == 'ids' or key in include}
+
+    def _search(self, query: np.ndarray, k: int):
+        scores: List[np.ndarray] = []
+        rowids: List[np.ndarray] = []
+        for shard in self._shards:
+            shard.nprobe = self.nprobe
+            D, I = shard.search(query[None, :], k)
+            found = I[0] >= 0
+            scores.append(D[0][found])
+            rowids.append(I[0][found])
+        if self._pending:
+            if self._pending_matrix is None:
+                self._pending_matrix = np.stack(self._pending)
+            scores.append(self._pending_matrix @ query)
+            rowids.append(np.array(self._pending_ids, dtype=np.int64))
+        if not scores:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+
+        # Merge the per-shard candidates into one top-k
+        all_scores = np.concatenate(scores)
+        all_rowids = np.concatenate(rowids)
+        top = np.argsort(-all_scores)[:k]
+        return all_scores[top], all_rowids[top]
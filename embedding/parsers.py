@@ -1,68 +1,87 @@
 from datetime import datetime
-import re
-import json
-from typing import List
+from functools import lru_cache
+import orjson
+from typing import Iterator, List, Optional
 from . import Message
 
-def parse_signal(file_path: str) -> List[Message]:
-    messages = []
-    with open(file_path, 'r') as f:
+# Exports often repeat the same timestamp string (several messages in one
+# second), so memoize the comparatively slow datetime parsing.
+@lru_cache(maxsize=8192)
+def _parse_imessage_ts(s: str) -> datetime:
+    return datetime.strptime(s, '%b %d, %Y %I:%M:%S %p')
+
+@lru_cache(maxsize=8192)
+def _parse_signal_ts(s: str) -> datetime:
+    return datetime.fromisoformat(s)
+
+def parse_signal(file_path: str) -> Iterator[Message]:
+    # orjson decodes bytes directly, so skip text decoding of the file
+    with open(file_path, 'rb') as f:
         for line in f:
             line = line.strip()
             if not line:
                 continue
 
             try:
-                data = json.loads(line)
+                data = orjson.loads(line)
                 message = Message(
-                    timestamp=datetime.fromisoformat(data['date']),
+                    timestamp=_parse_signal_ts(data['date']),
                     sender=data['sender'],
                     content=data['body'].strip()
                 )
-                messages.append(message)
-            except json.JSONDecodeError:
-                print(f"Failed to parse line: {line}")
+            except orjson.JSONDecodeError:
+                print(f"Failed to parse line: {line.decode(errors='replace')}")
                 continue
             except Exception as e:
                 print(f"Error processing line: {e}")
                 continue
 
-    return messages
+            yield message
 
-def parse_imessage(file_path: str) -> List[Message]:
-    with open(file_path, 'r', encoding='utf-8') as f:
-        content = f.read()
+def _strip_read_status(timestamp_line: str) -> str:
+    """
+    Drop a trailing "(Read ...)" status from an iMessage timestamp line.
+    """
+    if timestamp_line.endswith(')'):
+        idx = timestamp_line.find('(Read')
+        if idx >= 0:
+            return timestamp_line[:idx].rstrip()
+    return timestamp_line
 
-    # Split by empty lines to get message blocks
-    message_blocks = re.split(r'\n\n+', content)
-    messages = []
+def _parse_imessage_block(block: List[str]) -> Optional[Message]:
+    lines = '\n'.join(block).strip().split('\n')
+    if len(lines) < 2:
+        return None
 
-    for block in message_blocks:
-        if not block.strip():
-            continue
+    # Extract timestamp, read status
+    timestamp_line = lines[0].strip()
+    try:
+        timestamp = _parse_imessage_ts(_strip_read_status(timestamp_line))
+    except ValueError:
+        timestamp = None
 
-        lines = block.strip().split('\n')
-        if len(lines) < 2:
-            continue
+    return Message(
+        timestamp=timestamp,
+        sender=lines[1].strip(),
+        content='\n'.join(lines[2:]).strip()
+    )
 
-        # Extract timestamp, read status
-        timestamp_line = lines[0]
-        timestamp_match = re.match(r'(.*?)(\(Read.*\))?$', timestamp_line)
-
-        if timestamp_match:
-            try:
-                timestamp = datetime.strptime(
-                    timestamp_match.group(1).strip(), 
-                    '%b %d, %Y %I:%M:%S %p',
-                )
-            except ValueError:
-                timestamp = None
+def parse_imessage(file_path: str) -> Iterator[Message]:
+    # Single pass over the file: collect a block's lines until an empty line,
+    # then emit its message. Lines holding only spaces belong to the block.
+    block: List[str] = []
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line != '\n' and line != '\r\n':
+                block.append(line.rstrip('\n'))
+                continue
+            if block:
+                message = _parse_imessage_block(block)
+                if message is not None:
+                    yield message
+                block = []
 
-            msg = Message(
-                timestamp=timestamp,
-                sender=lines[1].strip(),
-                content='\n'.join(lines[2:]).strip()
-            )
-            messages.append(msg)
-    
-    return messages
+    if block:
+        message = _parse_imessage_block(block)
+        if message is not None:
+            yield message
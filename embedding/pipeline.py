@@ -0,0 +1,176 @@
+import queue
+import random
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+from chromadb.api.types import Documents, EmbeddingFunction
+from . import Message, chunk_messages
+from .db import VectorStore, filter_new_chunks, remove_superseded_chunks
+from .tinfoil_embedding import MAX_REQUEST_JITTER
+
+# End-of-stream marker passed between stages
+_DONE = object()
+
+
+def _drain(q: queue.Queue) -> Iterator[Any]:
+    """
+    Yield items from a queue until the end-of-stream marker.
+    """
+    while True:
+        item = q.get()
+        if item is _DONE:
+            return
+        yield item
+
+
+def ingest_messages(
+    messages: Iterable[Message],
+    collection: VectorStore,
+    embedding_function: EmbeddingFunction[Documents],
+    embed_workers: int = 4,
+    embedding_batch_size: int = 256,
+    upsert_batch_size: int = 250,
+    queue_size: int = 200,
+) -> Tuple[int, int]:
+    """
+    Parse, chunk, embed and store messages as a pipeline.
+
+    Each stage runs on its own thread(s) and hands work to the next through a
+    bounded queue, so parsing and chunking overlap with the network-bound
+    embedding and upsert stages while a slow stage applies backpressure.
+    Chunks already in the collection are skipped without being embedded, and
+    stored chunks that new ones supersede (the old tail of a grown export)
+    are deleted.
+
+    Args:
+        messages: Messages to ingest, typically a parser's output
+        collection: ChromaDB collection or other VectorStore
+        embedding_function: Embedding function used for the chunk texts
+        embed_workers: Number of concurrent embedding workers
+        embedding_batch_size: Number of chunks per embedding call
+        upsert_batch_size: Number of chunks per collection.add call
+        queue_size: Maximum number of messages buffered ahead of chunking
+
+    Returns:
+        Number of messages parsed and number of new chunks added
+    """
+    message_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    embed_queue: queue.Queue = queue.Queue(maxsize=embed_workers * 2)
+    upsert_queue: queue.Queue = queue.Queue(maxsize=embed_workers * 2)
+
+    # On failure every stage keeps draining its input and still forwards the
+    # end-of-stream marker, so no thread is left blocked on a full queue.
+    errors: List[BaseException] = []
+    counts = {'messages': 0, 'chunks': 0}
+
+    def parse():
+        try:
+            for message in messages:
+                if errors:
+                    break
+                message_queue.put(message)
+                counts['messages'] += 1
+        except Exception as e:
+            errors.append(e)
+        finally:
+            message_queue.put(_DONE)
+
+    def chunk():
+        incoming = _drain(message_queue)
+        try:
+            batch: List[Dict[str, Any]] = []
+            for c in chunk_messages(incoming):
+                if errors:
+                    break
+                batch.append(c)
+                if len(batch) == embedding_batch_size:
+                    embed_queue.put(batch)
+                    batch = []
+            if batch and not errors:
+                embed_queue.put(batch)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            for _ in incoming:
+                pass
+            for _ in range(embed_workers):
+                embed_queue.put(_DONE)
+
+    def embed():
+        try:
+            for batch in _drain(embed_queue):
+                if errors:
+                    continue
+                try:
+                    # Skip chunks stored by an earlier run before paying for embeddings
+                    batch = filter_new_chunks(collection, batch)
+                    if not batch:
+                        continue
+                    remove_superseded_chunks(collection, batch)
+                    # Workers start together; stagger their requests so they
+                    # don't reach the rate limiter at the same instant
+                    time.sleep(random.uniform(0, MAX_REQUEST_JITTER))
+                    embeddings = embedding_function([c['text'] for c in batch])
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                upsert_queue.put((batch, embeddings))
+        finally:
+            upsert_queue.put(_DONE)
+
+    def add(batch: List[Tuple[Dict[str, Any], Any]]):
+        collection.add(
+            ids=[c['id'] for c, _ in batch],
+            documents=[c['text'] for c, _ in batch],
+            metadatas=[c['metadata'] for c, _ in batch],
+            embeddings=[e for _, e in batch],
+        )
+        counts['chunks'] += len(batch)
+        print(f"Added {len(batch)} chunks ({counts['chunks']} total)")
+
+    def upsert():
+        running = embed_workers
+        pending: List[Tuple[Dict[str, Any], Any]] = []
+        while running:
+            item = upsert_queue.get()
+            if item is _DONE:
+                running -= 1
+                continue
+            if errors:
+                continue
+            try:
+                pending.extend(zip(*item))
+                while len(pending) >= upsert_batch_size:
+                    add(pending[:upsert_batch_size])
+                    del pending[:upsert_batch_size]
+            except Exception as e:
+                errors.append(e)
+        if pending and not errors:
+            try:
+                add(pending)
+            except Exception as e:
+                errors.append(e)
+
+    threads = [
+        threading.Thread(target=parse, name="parse"),
+        threading.Thread(target=chunk, name="chunk"),
+        *(threading.Thread(target=embed, name=f"embed-{i}") for i in range(embed_workers)),
+        threading.Thread(target=upsert, name="upsert"),
+    ]
+    for t in threads:
+        t.start()
+    try:
+        for t in threads:
+            t.join()
+    except BaseException as e:
+        # Ctrl-C lands here, not in a stage: record it so every stage stops
+        # and drains, and wait for them before re-raising
+        errors.append(e)
+        for t in threads:
+            t.join()
+        raise
+
+    if errors:
+        raise errors[0]
+
+    return counts['messages'], counts['chunks']
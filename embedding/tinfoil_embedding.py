@@ -1,9 +1,20 @@
+from concurrent.futures import ThreadPoolExecutor
+import random
+import time
 from chromadb.api.types import Embeddings, Documents, EmbeddingFunction
 from typing import List, Dict, Any, Optional
 import numpy as np
 from tinfoil import TinfoilAI
 
 
+# Rough characters-per-token ratio used to size requests without a tokenizer.
+CHARS_PER_TOKEN = 4
+
+# Upper bound on the random delay before each request, so concurrent batches
+# don't hit the enclave (and its rate limiter) at the same instant.
+MAX_REQUEST_JITTER = 0.05
+
+
 class TinfoilAIEmbeddingFunction(EmbeddingFunction[Documents]):
     def __init__(
         self,
@@ -11,12 +22,18 @@ class TinfoilAIEmbeddingFunction(EmbeddingFunction[Documents]):
         enclave: str = "",
         repo: str = "",
         model_name: str = "",
+        max_batch_tokens: int = 250_000,
+        max_concurrency: int = 5,
     ):
         self.api_key = api_key
         self.repo = repo
         self.enclave = enclave
         self.model_name = model_name
+        self.max_batch_tokens = max_batch_tokens
+        self.max_concurrency = max_concurrency
 
+        # One client per embedding function: its httpx connection pool is
+        # thread-safe and keeps connections alive across concurrent batches.
         self.client = TinfoilAI(
             api_key=self.api_key,
             enclave=self.enclave,
@@ -28,17 +45,58 @@ class TinfoilAIEmbeddingFunction(EmbeddingFunction[Documents]):
         if not input:
             return []
 
+        batches = self._batches(input)
+        if len(batches) == 1:
+            return self._embed(batches[0])
+
+        # Keep up to max_concurrency requests in flight; map() yields results
+        # in submission order, so the output lines up with the input.
+        embeddings: Embeddings = []
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            for batch_embeddings in executor.map(self._embed_with_jitter, batches):
+                embeddings.extend(batch_embeddings)
+        return embeddings
+
+    def _batches(self, input: Documents) -> List[Documents]:
+        """
+        Split documents into as few requests as possible, capping each request
+        at max_batch_tokens (estimated) instead of a fixed document count.
+        """
+        batches: List[Documents] = []
+        batch: Documents = []
+        batch_tokens = 0
+        for doc in input:
+            tokens = len(doc) // CHARS_PER_TOKEN + 1
+            if batch and batch_tokens + tokens > self.max_batch_tokens:
+                batches.append(batch)
+                batch = []
+                batch_tokens = 0
+            batch.append(doc)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _embed_with_jitter(self, batch: Documents) -> Embeddings:
+        time.sleep(random.uniform(0, MAX_REQUEST_JITTER))
+        return self._embed(batch)
+
+    def _embed(self, batch: Documents) -> Embeddings:
         # Prepare embedding parameters
         embedding_params: Dict[str, Any] = {
             "model": self.model_name,
-            "input": input,
+            "input": batch,
         }
 
-        # Get embeddings
+        # Get embeddings; the client retries 429s per request, honoring Retry-After
         response = self.client.embeddings.create(**embedding_params)
 
-        # Extract embeddings from response
-        return [np.array(data.embedding, dtype=np.float32) for data in response.data]
+        # Extract embeddings from response, in input order, L2-normalized so
+        # cosine and inner product agree and components share one range
+        data = sorted(response.data, key=lambda d: d.index)
+        embeddings = np.array([d.embedding for d in data], dtype=np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return list(embeddings)
 
     @staticmethod
     def name() -> str:
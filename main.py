@@ -1,13 +1,14 @@
 import os
-from typing import Dict, Any, List
-import chromadb
+import threading
+from typing import Dict, Any, List, Optional
 from tinfoil import TinfoilAI
 #from openai import OpenAI
 import argparse
 
-from embedding import chunk_messages
-from embedding.db import get_embedding_collection, add_chunks_to_chroma, query_messages
+from embedding.db import VectorStore, get_embedding_function, get_embedding_collection, query_messages
+from embedding.faiss_store import FaissStore
 from embedding.parsers import parse_imessage, parse_signal
+from embedding.pipeline import ingest_messages
 from server import run_server
 
 # client = OpenAI(
@@ -16,11 +17,24 @@ from server import run_server
 
 TINFOIL_API_KEY = os.getenv("TINFOIL_API_KEY")
 
-client = TinfoilAI(
-    enclave="llama3-3-70b.model.tinfoil.sh",
-    repo="tinfoilsh/confidential-llama3-3-70b",
-    api_key=TINFOIL_API_KEY,
-)
+_chat_client: Optional[TinfoilAI] = None
+_chat_client_lock = threading.Lock()
+
+def get_chat_client() -> TinfoilAI:
+    """
+    Create the chat client on first use and reuse it (and its verified,
+    pooled connections) for every later request. The lock keeps concurrent
+    first requests in the server from each attesting the enclave.
+    """
+    global _chat_client
+    with _chat_client_lock:
+        if _chat_client is None:
+            _chat_client = TinfoilAI(
+                enclave="llama3-3-70b.model.tinfoil.sh",
+                repo="tinfoilsh/confidential-llama3-3-70b",
+                api_key=TINFOIL_API_KEY,
+            )
+        return _chat_client
 
 def create_chat_response(query_results: Dict[str, Any], question: str):
     formatted_contexts = []
@@ -40,14 +54,14 @@ Please provide a concise answer based only on the information in these excerpts.
 Think critically and give the user a rough, unfiltered, and brutally honest answer to the question. Be concise and to the point, extremely short replies, less than 50 words.
 """
 
-    stream = client.chat.completions.create(
+    stream = get_chat_client().chat.completions.create(
         model="llama3-3-70b",
         messages=[
             {"role": "system", "content": "You are a helpful assistant analyzing text messages bwtween the four co-founders of Tinfoil."},
             {"role": "user", "content": prompt}
         ],
         stream=True,
-	seed: 123456
+        seed=123456,
     )
     
     return stream
@@ -60,13 +74,13 @@ def respond(query_results: Dict[str, Any], question: str) -> None:
     print("\n")
 
 
-def interactive_query(collection: chromadb.Collection, print_excerpts: bool = False):
+def interactive_query(collection: VectorStore, embedding_function, print_excerpts: bool = False):
     while True:
         question = input("🧠 > ")
         if question.lower() in ['exit', 'quit']:
             break
 
-        results = query_messages(collection, question)
+        results = query_messages(collection, embedding_function, question)
         respond(results, question)
 
         if print_excerpts:
@@ -82,14 +96,19 @@ if __name__ == "__main__":
     parser.add_argument('--file', type=str, help='Path to the text message file')
     parser.add_argument('--format', type=str, choices=['imessage', 'signal'], help='Format of the input file (imessage or signal)')
     parser.add_argument('--excerpts', action='store_true', help='Print excerpts')
-    parser.add_argument('--db', type=str, required=True, help='Path to the ChromaDB directory')
+    parser.add_argument('--db', type=str, required=True, help='Path to the vector database directory')
+    parser.add_argument('--backend', type=str, choices=['chroma', 'faiss'], default='chroma', help='Vector store backend (default: chroma)')
     parser.add_argument('--listen', type=int, default=0, help='Port to run the server on (default: none)')
     args = parser.parse_args()
 
-    collection = get_embedding_collection(args.db, TINFOIL_API_KEY)
+    embedding_function = get_embedding_function(TINFOIL_API_KEY)
+    if args.backend == "faiss":
+        collection = FaissStore(args.db)
+    else:
+        collection = get_embedding_collection(args.db, embedding_function)
 
     if args.listen > 0:
-        run_server(args.listen, collection, create_chat_response)
+        run_server(args.listen, collection, embedding_function, create_chat_response)
     elif args.file:
         if args.format == "":
             raise ValueError("Format is required")
@@ -99,14 +118,15 @@ if __name__ == "__main__":
             messages = parse_signal(args.file)
         else:
             raise ValueError(f"Invalid format: {args.format}")
-        print(f"Parsed {len(messages)} messages")
-
-        chunks = chunk_messages(messages)
-        print(f"Created {len(chunks)} chunks")
 
-        add_chunks_to_chroma(collection, chunks)
-        print("All chunks added to ChromaDB")
+        try:
+            message_count, chunk_count = ingest_messages(messages, collection, embedding_function)
+        finally:
+            # Write whatever was added, even if ingestion stopped early
+            if args.backend == "faiss":
+                collection.flush()
+        print(f"All chunks added to {args.backend}")
 
-        print(f"Successfully processed {len(messages)} messages into {len(chunks)} chunks")
+        print(f"Successfully processed {message_count} messages into {chunk_count} chunks")
     else:
-        interactive_query(collection, print_excerpts=args.excerpts)
+        interactive_query(collection, embedding_function, print_excerpts=args.excerpts)
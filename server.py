@@ -1,15 +1,22 @@
 import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict
 from fastapi import FastAPI, Request
 from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 import json
 import asyncio
-import chromadb
 
-from embedding.db import query_messages
+from embedding.db import VectorStore, query_messages
 
-def create_app(collection, create_chat_response_fn):
+# Returned by next() once the chat completion stream is exhausted
+_STREAM_END = object()
+
+QUERY_CACHE_SIZE = 1024
+
+def create_app(collection, embedding_function, create_chat_response_fn):
     app = FastAPI()
     app.add_middleware(
         CORSMiddleware,
@@ -19,6 +26,27 @@ def create_app(collection, create_chat_response_fn):
         allow_headers=["*"],
     )
 
+    # Repeated questions skip both the embedding round trip and the search.
+    # Entries are keyed on the normalized question, but retrieval always
+    # embeds the question as asked.
+    query_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+    query_cache_lock = threading.Lock()
+
+    def cached_query(question: str) -> Dict[str, Any]:
+        key = question.strip().lower()
+        with query_cache_lock:
+            if key in query_cache:
+                query_cache.move_to_end(key)
+                return query_cache[key]
+
+        results = query_messages(collection, embedding_function, question)
+
+        with query_cache_lock:
+            query_cache[key] = results
+            if len(query_cache) > QUERY_CACHE_SIZE:
+                query_cache.popitem(last=False)
+        return results
+
     @app.post("/v1/chat/completions")
     async def chat_completions(request: Request):
         body = await request.json()
@@ -32,17 +60,19 @@ def create_app(collection, create_chat_response_fn):
             return {"error": "No user message found"}
 
         question = user_messages[-1]["content"]
-        results = query_messages(collection, question)
-        stream = create_chat_response_fn(results, question)
+        # Retrieval and the completion request block, so keep them off the event loop
+        results = await asyncio.to_thread(cached_query, question)
+        stream = await asyncio.to_thread(create_chat_response_fn, results, question)
 
         async def generate():
             try:
-                for chunk in stream:
+                while True:
+                    chunk = await asyncio.to_thread(next, stream, _STREAM_END)
+                    if chunk is _STREAM_END:
+                        break
                     if chunk.choices[0].delta.content:
                         content = chunk.choices[0].delta.content
                         yield f"data: {json.dumps({'choices': [{'delta': {'content': content}}]})}\n\n"
-                        # Force flush the response
-                        await asyncio.sleep(0)
                 yield "data: [DONE]\n\n"
             except Exception as e:
                 print(f"Error in stream: {e}")
@@ -62,7 +92,7 @@ def create_app(collection, create_chat_response_fn):
 
     return app
 
-def run_server(port: int, collection: chromadb.Collection, create_chat_response_fn):
-    app = create_app(collection, create_chat_response_fn)
+def run_server(port: int, collection: VectorStore, embedding_function, create_chat_response_fn):
+    app = create_app(collection, embedding_function, create_chat_response_fn)
     print(f"Starting server on port {port}...")
     uvicorn.run(app, host="0.0.0.0", port=port) 
@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from embedding import Message, chunk_messages
+
+
+def baseline_chunk_messages(messages, chunk_size=10, overlap=2):
+    # The original list-slicing implementation, kept as the reference output
+    chunks = []
+    for i in range(0, len(messages), chunk_size - overlap):
+        window = messages[i:i + chunk_size]
+        if len(window) < 2:
+            continue
+
+        start_time = int(window[0].timestamp.timestamp())
+        end_time = int(window[-1].timestamp.timestamp())
+        chunks.append({
+            'id': f"chunk_{i}_{start_time}_{end_time}",
+            'text': "\n".join(f"[{m.timestamp}] {m.sender}: {m.content}" for m in window),
+            'message_count': len(window),
+        })
+    return chunks
+
+
+def make_messages(n):
+    start = datetime(2024, 1, 1)
+    return [
+        Message(timestamp=start + timedelta(minutes=i), sender="ab"[i % 3 == 0], content=f"message {i}")
+        for i in range(n)
+    ]
+
+
+@pytest.mark.parametrize('chunk_size,overlap', [
+    (10, 2), (5, 1), (3, 0), (2, 0), (2, 1), (4, 3), (10, 9),
+])
+@pytest.mark.parametrize('n', [0, 1, 2, 3, 4, 5, 9, 10, 11, 17, 18, 19, 20, 41])
+def test_chunk_messages_matches_baseline(n, chunk_size, overlap):
+    messages = make_messages(n)
+
+    # Pass an iterator so the rolling window cannot rely on len() or slicing
+    chunks = list(chunk_messages(iter(messages), chunk_size, overlap))
+    expected = baseline_chunk_messages(messages, chunk_size, overlap)
+
+    assert [c['id'] for c in chunks] == [c['id'] for c in expected]
+    assert [c['text'] for c in chunks] == [c['text'] for c in expected]
+    assert [c['metadata']['message_count'] for c in chunks] == [c['message_count'] for c in expected]
+
+
+def test_chunk_senders_keep_first_appearance_order():
+    [chunk] = chunk_messages(make_messages(4), chunk_size=10, overlap=2)
+    assert chunk['metadata']['senders'] == "b,a"
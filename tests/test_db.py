@@ -0,0 +1,62 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+chromadb = pytest.importorskip("chromadb")
+
+from embedding import Message, chunk_messages
+from embedding.db import filter_new_chunks, remove_superseded_chunks
+
+
+def make_messages(n):
+    start = datetime(2024, 1, 1)
+    return [Message(timestamp=start + timedelta(minutes=i), sender="a", content=f"m{i}") for i in range(n)]
+
+
+def store(collection, chunks):
+    collection.add(
+        ids=[c['id'] for c in chunks],
+        documents=[c['text'] for c in chunks],
+        metadatas=[c['metadata'] for c in chunks],
+        embeddings=[[float(len(c['text'])), 1.0] for c in chunks],
+    )
+
+
+@pytest.fixture
+def collection():
+    client = chromadb.EphemeralClient()
+    return client.create_collection(name=f"test_{uuid.uuid4().hex}", embedding_function=None)
+
+
+def test_filter_new_chunks_skips_stored_ids(collection):
+    chunks = list(chunk_messages(make_messages(30)))
+    store(collection, chunks[:2])
+
+    assert filter_new_chunks(collection, chunks) == chunks[2:]
+
+
+def test_grown_export_replaces_old_tail_chunks(collection):
+    store(collection, list(chunk_messages(make_messages(20))))
+
+    grown = list(chunk_messages(make_messages(26)))
+    new_chunks = filter_new_chunks(collection, grown)
+    removed = remove_superseded_chunks(collection, new_chunks)
+    store(collection, new_chunks)
+
+    # The 20-message export's 4-message tail chunk starting at 16 was replaced
+    assert removed == 1
+    stored = collection.get(include=['metadatas'])
+    assert sorted(stored['ids']) == sorted(c['id'] for c in grown)
+
+
+def test_remove_superseded_chunks_keeps_other_files(collection):
+    # Same start index, different start time: a chunk from another export
+    other = list(chunk_messages([
+        Message(timestamp=datetime(2023, 1, 1) + timedelta(minutes=i), sender="b", content=f"o{i}")
+        for i in range(4)
+    ]))
+    store(collection, other)
+
+    assert remove_superseded_chunks(collection, list(chunk_messages(make_messages(10)))) == 0
+    assert collection.get()['ids'] == [other[0]['id']]
@@ -0,0 +1,217 @@
+import os
+import sqlite3
+
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+from embedding.faiss_store import FaissStore
+
+DIM = 32
+TRAIN_SIZE = 400
+
+
+def open_store(path, **kwargs):
+    return FaissStore(
+        str(path), dim=DIM, nlist=8, m=8, nbits=4,
+        train_size=TRAIN_SIZE, shard_size=300, nprobe=8, **kwargs,
+    )
+
+
+def make_vectors(n, seed):
+    vectors = np.random.default_rng(seed).normal(size=(n, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def add_chunks(store, start, vectors):
+    ids = [f"chunk_{i}" for i in range(start, start + len(vectors))]
+    store.add(
+        ids=ids,
+        embeddings=list(vectors),
+        metadatas=[{'n': i} for i in range(start, start + len(vectors))],
+        documents=[f"doc {i}" for i in range(start, start + len(vectors))],
+    )
+    return ids
+
+
+def unflushed_count(store):
+    return store._db.execute("SELECT COUNT(*) FROM unflushed").fetchone()[0]
+
+
+def vector_count(store):
+    return sum(shard.ntotal for shard in store._shards) + len(store._pending)
+
+
+def assert_finds_itself(store, chunk_id, vector, k=5):
+    results = store.query(query_embeddings=[vector], n_results=k)
+    assert chunk_id in results['ids'][0]
+    i = results['ids'][0].index(chunk_id)
+    assert results['documents'][0][i] == f"doc {chunk_id.split('_')[1]}"
+    assert results['metadatas'][0][i] == {'n': int(chunk_id.split('_')[1])}
+
+
+def test_round_trip_before_training(tmp_path):
+    store = open_store(tmp_path)
+    vectors = make_vectors(100, seed=0)
+    ids = add_chunks(store, 0, vectors)
+
+    assert not store._trained
+    got = store.get(ids=[ids[3], "missing", ids[7]])
+    assert got['ids'] == [ids[3], ids[7]]
+    assert got['documents'] == ["doc 3", "doc 7"]
+    assert got['metadatas'] == [{'n': 3}, {'n': 7}]
+    assert store.get(ids=ids, include=[]) == {'ids': ids}
+
+    # Untrained vectors are searched exactly
+    results = store.query(query_embeddings=[vectors[42]], n_results=3)
+    assert results['ids'][0][0] == ids[42]
+    assert results['distances'][0][0] == pytest.approx(0, abs=1e-5)
+
+
+def test_round_trip_after_training(tmp_path):
+    store = open_store(tmp_path)
+    vectors = make_vectors(700, seed=1)
+    ids = add_chunks(store, 0, vectors[:450])
+    ids += add_chunks(store, 450, vectors[450:])
+
+    assert store._trained
+    assert len(store._shards) == 3
+    assert vector_count(store) == 700
+    assert store.get(ids=ids, include=[])['ids'] == ids
+    for i in (0, 420, 699):
+        assert_finds_itself(store, ids[i], vectors[i])
+
+
+def test_reopen_after_flush(tmp_path):
+    store = open_store(tmp_path)
+    vectors = make_vectors(500, seed=2)
+    ids = add_chunks(store, 0, vectors)
+    store.flush()
+
+    reopened = open_store(tmp_path)
+    assert reopened._trained
+    assert vector_count(reopened) == 500
+    assert reopened.get(ids=ids, include=[])['ids'] == ids
+    for i in (0, 250, 499):
+        assert_finds_itself(reopened, ids[i], vectors[i])
+
+
+def test_reopen_before_training(tmp_path):
+    store = open_store(tmp_path)
+    vectors = make_vectors(50, seed=3)
+    ids = add_chunks(store, 0, vectors)
+
+    reopened = open_store(tmp_path)
+    assert not reopened._trained
+    assert vector_count(reopened) == 50
+    assert reopened.query(query_embeddings=[vectors[10]], n_results=1)['ids'] == [[ids[10]]]
+
+
+def test_reopen_without_flush_keeps_vectors(tmp_path):
+    store = open_store(tmp_path)
+    vectors = make_vectors(650, seed=4)
+    ids = add_chunks(store, 0, vectors[:500])
+    store.flush()
+    ids += add_chunks(store, 500, vectors[500:])
+
+    # Simulate a crash: the last batch never reached a shard file
+    reopened = open_store(tmp_path)
+    assert vector_count(reopened) == 650
+    assert_finds_itself(reopened, ids[600], vectors[600])
+
+    reopened.flush()
+    assert vector_count(open_store(tmp_path)) == 650
+
+
+def test_interrupted_flush_does_not_duplicate_vectors(tmp_path):
+    store = open_store(tmp_path)
+    vectors = make_vectors(500, seed=5)
+    add_chunks(store, 0, vectors)
+
+    # Shard files written, but the process died before the SQLite cleanup
+    for n, shard in enumerate(store._shards):
+        faiss.write_index(shard, store._shard_path(n))
+
+    reopened = open_store(tmp_path)
+    assert vector_count(reopened) == 500
+
+
+def test_duplicate_ids_are_ignored(tmp_path):
+    store = open_store(tmp_path)
+    vectors = make_vectors(500, seed=6)
+    ids = add_chunks(store, 0, vectors[:450])
+
+    store.add(
+        ids=[ids[0], "chunk_new", "chunk_new"],
+        embeddings=list(vectors[450:453]),
+        metadatas=[{'n': -1}] * 3,
+        documents=["replaced", "new", "new again"],
+    )
+
+    assert vector_count(store) == 451
+    assert store.get(ids=[ids[0]])['documents'] == ["doc 0"]
+    assert store.get(ids=["chunk_new"])['documents'] == ["new"]
+
+    results = store.query(query_embeddings=[vectors[0]], n_results=10)
+    assert len(results['ids'][0]) == len(set(results['ids'][0]))
+
+
+def test_get_where_and_delete(tmp_path):
+    store = open_store(tmp_path)
+    vectors = make_vectors(500, seed=7)
+    ids = add_chunks(store, 0, vectors[:320])
+    store.flush()
+    ids += add_chunks(store, 320, vectors[320:])
+
+    assert store.get(where={'n': 5}, include=[])['ids'] == [ids[5]]
+    got = store.get(where={'n': {'$in': [1, 400, 9999]}}, include=['metadatas'])
+    assert got == {'ids': [ids[1], ids[400]], 'metadatas': [{'n': 1}, {'n': 400}]}
+
+    # One flushed and one unflushed vector
+    store.delete(ids=[ids[1], ids[400]])
+    assert vector_count(store) == 498
+    assert store.get(ids=[ids[1], ids[400], ids[2]], include=[])['ids'] == [ids[2]]
+    results = store.query(query_embeddings=[vectors[400]], n_results=10)
+    assert ids[400] not in results['ids'][0]
+
+    store.flush()
+    reopened = open_store(tmp_path)
+    assert vector_count(reopened) == 498
+    assert_finds_itself(reopened, ids[2], vectors[2])
+
+
+def test_checkpoints_keep_sidecar_small(tmp_path):
+    store = open_store(tmp_path, checkpoint_size=100)
+    vectors = make_vectors(1000, seed=8)
+    sidecar = os.path.join(str(tmp_path), "chunks.sqlite")
+
+    # Before training the raw vectors are kept for training
+    add_chunks(store, 0, vectors[:390])
+    assert unflushed_count(store) == 390
+    size_before_training = os.path.getsize(sidecar)
+
+    for start in range(390, 1000, 10):
+        add_chunks(store, start, vectors[start:start + 10])
+        assert unflushed_count(store) < 100
+    store.flush()
+
+    assert unflushed_count(store) == 0
+    assert store._db.execute("PRAGMA freelist_count").fetchone()[0] == 0
+    # The space held by 390 raw vectors was returned to the filesystem,
+    # even though 1000 chunks are now stored
+    assert os.path.getsize(sidecar) < size_before_training
+
+    reopened = open_store(tmp_path)
+    assert vector_count(reopened) == 1000
+    assert_finds_itself(reopened, "chunk_995", vectors[995])
+
+
+def test_existing_sidecar_switches_to_incremental_vacuum(tmp_path):
+    db = sqlite3.connect(os.path.join(str(tmp_path), "chunks.sqlite"))
+    db.execute("CREATE TABLE t (x)")
+    db.commit()
+    db.close()
+
+    store = open_store(tmp_path)
+    assert store._db.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
@@ -0,0 +1,67 @@
+import re
+from datetime import datetime
+
+import pytest
+
+from embedding import Message
+from embedding.parsers import parse_imessage
+
+
+def baseline_parse_imessage(file_path):
+    # The original whole-file implementation, kept as the reference output
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    messages = []
+    for block in re.split(r'\n\n+', content):
+        if not block.strip():
+            continue
+
+        lines = block.strip().split('\n')
+        if len(lines) < 2:
+            continue
+
+        timestamp_match = re.match(r'(.*?)(\(Read.*\))?$', lines[0])
+        if timestamp_match:
+            try:
+                timestamp = datetime.strptime(
+                    timestamp_match.group(1).strip(),
+                    '%b %d, %Y %I:%M:%S %p',
+                )
+            except ValueError:
+                timestamp = None
+
+            messages.append(Message(
+                timestamp=timestamp,
+                sender=lines[1].strip(),
+                content='\n'.join(lines[2:]).strip()
+            ))
+
+    return messages
+
+
+@pytest.mark.parametrize('content', [
+    # Read status, multi-line body, runs of empty lines
+    'Jan 02, 2024  3:04:05 PM (Read by them Jan 02)\nAlice\nhello\nsecond line\n\n\n\n'
+    'Jan 03, 2024 11:00:00 AM\nBob\nhi\n',
+    # A whitespace-only line inside a body is not a block separator
+    'Jan 02, 2024  3:04:05 PM\nAlice\nfirst para\n \nsecond para\n\nJan 03, 2024 11:00:00 AM\nBob\nhi',
+    # Whitespace-only lines around a block
+    '\n \nJan 02, 2024  3:04:05 PM\nAlice\nhello\n\t\n\nJan 03, 2024 11:00:00 AM\nBob\nhi\n  ',
+    # Blocks too short to be messages, unparseable timestamps, CRLF endings
+    'lonely\n\nbad ts\nCarol\nyo\n\nJan 02, 2024  3:04:05 PM\r\nDan\r\nhey\r\n\r\n',
+    '',
+])
+def test_parse_imessage_matches_baseline(tmp_path, content):
+    path = tmp_path / 'chat.txt'
+    path.write_bytes(content.encode('utf-8'))
+
+    assert list(parse_imessage(str(path))) == baseline_parse_imessage(str(path))
+
+
+def test_parse_imessage_keeps_body_after_whitespace_line(tmp_path):
+    path = tmp_path / 'chat.txt'
+    path.write_text('Jan 02, 2024  3:04:05 PM\nAlice\nfirst para\n \nsecond para\n')
+
+    [message] = parse_imessage(str(path))
+    assert message.content == 'first para\n \nsecond para'
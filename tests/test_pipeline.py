@@ -0,0 +1,141 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from embedding import Message
+from embedding.pipeline import ingest_messages
+
+TIMEOUT = 10
+
+
+class FakeCollection:
+    """
+    Dict-backed stand-in for the parts of the VectorStore API the pipeline uses.
+    """
+
+    def __init__(self, fail_on_add=False):
+        self.records = {}
+        self.fail_on_add = fail_on_add
+        self.lock = threading.Lock()
+
+    def add(self, ids, embeddings, metadatas, documents):
+        if self.fail_on_add:
+            raise RuntimeError("add failed")
+        with self.lock:
+            for i, e, m, d in zip(ids, embeddings, metadatas, documents):
+                self.records[i] = (e, m, d)
+
+    def get(self, ids=None, where=None, include=None):
+        with self.lock:
+            if ids is not None:
+                found = [i for i in ids if i in self.records]
+            else:
+                [(key, cond)] = where.items()
+                values = cond['$in'] if isinstance(cond, dict) else [cond]
+                found = [i for i, (_, m, _) in self.records.items() if m.get(key) in values]
+            return {'ids': found, 'metadatas': [self.records[i][1] for i in found]}
+
+    def delete(self, ids):
+        with self.lock:
+            for i in ids:
+                self.records.pop(i, None)
+
+
+class FakeEmbeddingFunction:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = 0
+
+    def __call__(self, input):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError("embedding failed")
+        return [[float(len(text)), 1.0] for text in input]
+
+
+def make_messages(n):
+    start = datetime(2024, 1, 1)
+    return [Message(timestamp=start + timedelta(minutes=i), sender="a", content=f"m{i}") for i in range(n)]
+
+
+def run(messages, collection, embedding_function, **kwargs):
+    """
+    Run ingest_messages on a thread so a deadlock fails the test instead of hanging it.
+    """
+    result = {}
+
+    def target():
+        try:
+            result['value'] = ingest_messages(
+                messages, collection, embedding_function,
+                embed_workers=3, embedding_batch_size=4, upsert_batch_size=5, queue_size=8,
+                **kwargs,
+            )
+        except BaseException as e:
+            result['error'] = e
+
+    t = threading.Thread(target=target, daemon=True)
+    t.start()
+    t.join(TIMEOUT)
+    assert not t.is_alive(), "ingest_messages did not return"
+    if 'error' in result:
+        raise result['error']
+    return result['value']
+
+
+def test_counts_messages_and_chunks():
+    collection = FakeCollection()
+
+    # 500 messages in chunks of 10 overlapping by 2
+    assert run(iter(make_messages(500)), collection, FakeEmbeddingFunction()) == (500, 63)
+    assert len(collection.records) == 63
+
+
+def test_second_run_adds_nothing():
+    collection = FakeCollection()
+    run(make_messages(200), collection, FakeEmbeddingFunction())
+
+    embedding_function = FakeEmbeddingFunction()
+    assert run(make_messages(200), collection, embedding_function) == (200, 0)
+    assert embedding_function.calls == 0
+
+
+def test_grown_export_replaces_old_tail_chunks():
+    collection = FakeCollection()
+    run(make_messages(203), collection, FakeEmbeddingFunction())
+    before = set(collection.records)
+
+    messages, chunks = run(make_messages(210), collection, FakeEmbeddingFunction())
+    assert (messages, chunks) == (210, 2)
+
+    # The 3-message tail chunk starting at 200 became a 10-message chunk,
+    # followed by a new tail chunk starting at 208
+    [removed] = before - set(collection.records)
+    assert removed.startswith("chunk_200_")
+    assert len(collection.records) == len(before) + 1
+
+
+def test_empty_input():
+    collection = FakeCollection()
+    assert run(iter([]), collection, FakeEmbeddingFunction()) == (0, 0)
+    assert collection.records == {}
+
+
+def test_parser_error_is_raised():
+    def failing_parser():
+        yield from make_messages(300)
+        raise ValueError("bad export")
+
+    with pytest.raises(ValueError, match="bad export"):
+        run(failing_parser(), FakeCollection(), FakeEmbeddingFunction())
+
+
+def test_embedding_error_is_raised():
+    with pytest.raises(RuntimeError, match="embedding failed"):
+        run(make_messages(1000), FakeCollection(), FakeEmbeddingFunction(fail=True))
+
+
+def test_add_error_is_raised():
+    with pytest.raises(RuntimeError, match="add failed"):
+        run(make_messages(1000), FakeCollection(fail_on_add=True), FakeEmbeddingFunction())